@@ -1,45 +1,50 @@
+import itertools
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import pandas as pd
-from openpyxl.reader.excel import load_workbook
-from openpyxl.styles import Border, Side, PatternFill, Font, Alignment
 
-def coalesce_and_clean_merged_columns(df):
+# Filtered frames are only read or relabelled, never written through, so let pandas
+# share their data instead of taking defensive copies (always on from pandas 3, where
+# setting the option is deprecated)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
+
+def write_formatted_sheet(writer, sheet_name, df):
     """
-    Identifies columns ending with '_x' and '_y' in a DataFrame,
-    coalesces them into a single column (preferring _y if available),
-    and then drops the original suffixed columns.
+    Writes a DataFrame to a new sheet with the standard header/body styling.
 
-    Args:
-        df (pd.DataFrame): The DataFrame after a merge operation that resulted
-                           in _x and _y suffixes.
+    Column formats are set before any cell is written and rows are written top to bottom,
+    as required by xlsxwriter's constant_memory mode (DataFrame.to_excel writes column by column).
 
-    Returns:
-        pd.DataFrame: The DataFrame with coalesced and cleaned column names.
+    Args:
+        writer (pd.ExcelWriter): An ExcelWriter using the xlsxwriter engine.
+        sheet_name (str): The name of the sheet to create.
+        df (pd.DataFrame): The DataFrame to write (without its index).
     """
-    columns_to_process = {}
-    for col in df.columns:
-        if col.endswith('_x'):
-            base_name = col[:-2] # Remove '_x'
-            y_col = f"{base_name}_y"
-            if y_col in df.columns:
-                columns_to_process[base_name] = (col, y_col)
-
-    if not columns_to_process:
-        print("No columns found ending with '_x' and '_y' for coalescing.")
-        return df # No changes needed
-
-    print(f"Coalescing {len(columns_to_process)} sets of columns:")
-    cols_to_drop = []
-    for base_name, (x_col, y_col) in columns_to_process.items():
-        print(f"  - Coalescing '{x_col}' and '{y_col}' into '{base_name}'")
-        # Coalesce: prefer value from _y (right DataFrame), fall back to _x (left DataFrame)
-        df[base_name] = df[y_col].fillna(df[x_col])
-        cols_to_drop.extend([x_col, y_col]) # Mark suffixed columns for dropping
-
-    df.drop(columns=cols_to_drop, inplace=True)
-    print("Coalescing complete and original suffixed columns dropped.")
-    return df
+    workbook = writer.book
+    worksheet = workbook.add_worksheet(sheet_name)
+
+    header_format = workbook.add_format({'bold': True, 'font_name': 'Arial', 'font_size': 10,
+                                         'bg_color': '#D3D3D3', 'border': 1,
+                                         'text_wrap': True, 'valign': 'top'})
+    body_format = workbook.add_format({'font_name': 'Arial', 'font_size': 10, 'border': 1,
+                                       'text_wrap': True, 'valign': 'top'})
+
+    # Column widths: code, name, then a default width for all other columns
+    worksheet.set_column(0, 0, 10, body_format)
+    worksheet.set_column(1, 1, 90, body_format)
+    if len(df.columns) > 2:
+        worksheet.set_column(2, len(df.columns) - 1, 18, body_format)
+
+    worksheet.set_row(0, None, header_format)
+    worksheet.write_row(0, 0, df.columns.tolist(), header_format)
+
+    # Missing values are left as empty cells
+    rows = df.astype(object).where(df.notna(), None)
+    for row_index, row in enumerate(rows.itertuples(index=False, name=None), start=1):
+        worksheet.write_row(row_index, 0, row)
 
 
 def combine_sheets_from_multiple_excels(input_excel_paths, output_excel_path):
@@ -53,10 +58,15 @@ def combine_sheets_from_multiple_excels(input_excel_paths, output_excel_path):
     """
     print(f"Starting to combine sheets into '{output_excel_path}'...")
 
-    sheets = []
-
     # Create an ExcelWriter object to write multiple sheets to a single Excel file
-    with pd.ExcelWriter(output_excel_path, engine='xlsxwriter') as writer:
+    # constant_memory flushes each row as soon as the next one starts, so memory does not grow
+    # with the size of the combined workbook. Dates get the same format DataFrame.to_excel uses,
+    # and +/-inf is written as an Excel error value instead of failing the sheet half-way
+    writer_options = {'constant_memory': True,
+                      'default_date_format': 'YYYY-MM-DD HH:MM:SS',
+                      'nan_inf_to_errors': True}
+    with pd.ExcelWriter(output_excel_path, engine='xlsxwriter',
+                        engine_kwargs={'options': writer_options}) as writer:
         for excel_file_path in input_excel_paths:
             if not os.path.exists(excel_file_path):
                 print(f"  Warning: '{excel_file_path}' not found. Skipping.")
@@ -64,17 +74,14 @@ def combine_sheets_from_multiple_excels(input_excel_paths, output_excel_path):
 
             try:
                 # Read all sheets from the current Excel file
-                xls = pd.ExcelFile(excel_file_path)
-                sheet_names = xls.sheet_names
-                print(f"  Processing '{os.path.basename(excel_file_path)}' with sheets: {sheet_names}")
+                sheets = pd.read_excel(excel_file_path, sheet_name=None, engine='calamine')
+                print(f"  Processing '{os.path.basename(excel_file_path)}' with sheets: {list(sheets)}")
 
-                for sheet_name in sheet_names:
-                    df = pd.read_excel(xls, sheet_name=sheet_name)
+                for sheet_name, df in sheets.items():
 
                     # Write the DataFrame to a new sheet in the output Excel file
-                    df.to_excel(writer, sheet_name=sheet_name, index=False)
+                    write_formatted_sheet(writer, sheet_name, df)
                     print(f"    Added sheet '{sheet_name}' as '{sheet_name}'.")
-                    sheets.append(sheet_name)
 
             except Exception as e:
                 print(f"  Error processing '{excel_file_path}': {e}")
@@ -82,46 +89,53 @@ def combine_sheets_from_multiple_excels(input_excel_paths, output_excel_path):
 
     print(f"Successfully combined all sheets into '{output_excel_path}'.")
 
-    # Load the workbook and reorder sheets
-    wb = load_workbook(output_excel_path)
-
-    for sheet_n in sheets:
 
-        # Apply formatting
-        sheet = wb[sheet_n]
-
-        # Define the borders
-        border_style = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        default_font = Font(name='Arial', size=10)
-
-        header_font = Font(name='Arial', size=10, bold=True)
-        # Define fill
-        header_fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")  # Light Blue
-
-        # Set column widths for the first two columns
-        sheet.column_dimensions['A'].width = 10  # Adjust as needed
-        sheet.column_dimensions['B'].width = 90  # Adjust as needed
-
-        # Apply default width and formatting to all columns
-        for column_letter in sheet.columns:
-            col_dim = sheet.column_dimensions[column_letter[0].column_letter]
-            if column_letter[0].column_letter not in ['A', 'B']:
-                col_dim.width = 18  # Default width for other columns
-            for row_index, cell in enumerate(column_letter):
-                cell.alignment = Alignment(wrap_text=True, vertical='top')
-                cell.border = border_style
-                if row_index == 0:  # Header row
-                    cell.font = header_font
-                    cell.fill = header_fill
-                else:
-                    cell.font = default_font
+def iter_aligned_sheets(sheets, input_file, base_columns, interested_branch_columns):
+    """
+    Yields the 'GM' rows of each COMEDK ranking sheet, restricted to the base columns and the
+    interested branch columns offered in that sheet. Sheets missing a base column are skipped.
 
-    wb.save(output_excel_path)
+    Args:
+        sheets (dict): Sheet name to DataFrame, as returned by pd.read_excel(..., sheet_name=None).
+                       Sheets are removed from the dict as they are consumed.
+        input_file (str): Path of the workbook the sheets were read from (used in messages).
+        base_columns (list): Columns identifying a college row.
+        interested_branch_columns (list): Full branch column names (e.g., '30316-Aeronautical Engineering').
+
+    Yields:
+        pd.DataFrame: The aligned 'GM' data of one sheet.
+    """
+    for sheet_name in list(sheets):
+        # Pop each sheet so the full sheet can be released once its GM rows are extracted
+        df_sheet = sheets.pop(sheet_name)
+        print(f'  processing sheet {sheet_name}')
+        if 'Seat Type' in df_sheet.columns:
+            df_sheet.rename(columns={'Seat Type': 'Seat Category'}, inplace=True)
+            print(f"Renamed 'Seat Type' to 'Seat Category' in '{input_file}'.")
+        elif 'Seat type' in df_sheet.columns:
+            df_sheet.rename(columns={'Seat type': 'Seat Category'}, inplace=True)
+            print(f"Renamed 'Seat type' to 'Seat Category' in '{input_file}'.")
+        elif 'Seat Category' not in df_sheet.columns:
+            print(f"Warning: Neither 'Seat Type' nor 'Seat Category' found in '{input_file}'.")
+            # Optional: df_sheet['Seat Category'] = pd.NA # Add an empty column if needed
+
+        # Ensure base columns exist in the current sheet
+        if not all(col in df_sheet.columns for col in base_columns):
+            missing_cols = [col for col in base_columns if col not in df_sheet.columns]
+            print(
+                f"Error: Required base columns {missing_cols} not found in sheet '{sheet_name}' of file '{input_file}'. Skipping this sheet.")
+            continue
+
+        # Categorical keys make the 'GM' filter and the later grouping compare integer codes
+        df_sheet = df_sheet.astype({col: 'category' for col in base_columns})
+
+        # Filter for 'GM' category
+        df_gm = df_sheet[df_sheet['Seat Category'] == 'GM']
+        df_gm.columns = df_gm.columns.str.replace('\n', '')
+        # Select the base columns and the interested branch columns offered in this sheet in one go
+        present_branch_columns = [col for col in interested_branch_columns if col in df_gm.columns]
+        df_aligned_sheet = df_gm[base_columns + present_branch_columns]
+        yield df_aligned_sheet
 
 
 def process_comedk_data(folder_path, branch_codes_file_name, input_excel_name):
@@ -145,8 +159,8 @@ def process_comedk_data(folder_path, branch_codes_file_name, input_excel_name):
 
         # 1. Read COMEDK_BRANCH_CODES.xlsx to get interested branch codes and their full names
         print(f"Reading branch codes from: {branch_codes_full_path}")
-        df_branch_codes = pd.read_excel(branch_codes_full_path)
-        interested_branches_df = df_branch_codes[df_branch_codes['Interested'] == 'Y'].copy()
+        df_branch_codes = pd.read_excel(branch_codes_full_path, engine='calamine')
+        interested_branches_df = df_branch_codes[df_branch_codes['Interested'] == 'Y']
 
         # Create a list of full branch column names (e.g., '30316-Aeronautical Engineering')
         # for all interested branches. This defines the final desired columns for branches.
@@ -156,8 +170,6 @@ def process_comedk_data(folder_path, branch_codes_file_name, input_excel_name):
         ]
         print(all_potential_interested_branch_columns)
 
-        all_processed_data = []
-
         # Find the COMEDK_R*.xlsx file(s) in the specified folder
         input_file = os.path.join(folder_path, input_excel_name)
 
@@ -166,71 +178,21 @@ def process_comedk_data(folder_path, branch_codes_file_name, input_excel_name):
 
         # 2. Process the COMEDK_R*.xlsx file(s)
         print(f"Processing COMEDK ranking file: {input_file}")
-        xl = pd.ExcelFile(input_file)
-        for sheet_name in xl.sheet_names:
-            print(f'  processing sheet {sheet_name}')
-            df_sheet = pd.read_excel(xl, sheet_name=sheet_name)
-            if 'Seat Type' in df_sheet.columns:
-                df_sheet.rename(columns={'Seat Type': 'Seat Category'}, inplace=True)
-                print(f"Renamed 'Seat Type' to 'Seat Category' in '{input_file}'.")
-            elif 'Seat type' in df_sheet.columns:
-                df_sheet.rename(columns={'Seat type': 'Seat Category'}, inplace=True)
-                print(f"Renamed 'Seat type' to 'Seat Category' in '{input_file}'.")
-            elif 'Seat Category' not in df_sheet.columns:
-                print(f"Warning: Neither 'Seat Type' nor 'Seat Category' found in '{input_file}'.")
-                # Optional: df_sheet['Seat Category'] = pd.NA # Add an empty column if needed
-
-            # Ensure base columns exist in the current sheet
-            if not all(col in df_sheet.columns for col in base_columns):
-                missing_cols = [col for col in base_columns if col not in df_sheet.columns]
-                print(
-                    f"Error: Required base columns {missing_cols} not found in sheet '{sheet_name}' of file '{input_file}'. Skipping this sheet.")
-                continue
+        sheets = pd.read_excel(input_file, sheet_name=None, engine='calamine')
+        aligned_sheets = iter_aligned_sheets(sheets, input_file, base_columns, all_potential_interested_branch_columns)
 
-            # Filter for 'GM' category
-            df_gm = df_sheet[df_sheet['Seat Category'] == 'GM'].copy()
-            df_gm.columns = df_gm.columns.str.replace('\n', '')
-            # Create a temporary DataFrame to hold the selected and aligned data for this sheet
-            # Initialize with base columns and all potential interested branch columns, filled with pd.NA
-            # This ensures all target columns are present from the start for this sheet's data
-            df_aligned_sheet = pd.DataFrame()
-            # Populate base columns
-            for col in base_columns:
-                if col in df_gm.columns:
-                    df_aligned_sheet[col] = df_gm[col]
-                else:
-                    print(f'col {col} not in base_columns')
-                # If a base column is missing, it was already caught by the 'if not all(col in df_sheet.columns...' check
-
-            # Populate interested branch columns, preserving existing data
-            for interested_col_name in all_potential_interested_branch_columns:
-                # Check if the interested column exists in the current sheet's GM filtered data
-                if interested_col_name in df_gm.columns:
-                    df_aligned_sheet[interested_col_name] = df_gm[interested_col_name]
-            all_processed_data.append(df_aligned_sheet)
-
-        if not all_processed_data:
+        first_aligned_sheet = next(aligned_sheets, None)
+        if first_aligned_sheet is None:
             print("No 'GM' category data found in any of the input files for the specified branches.")
             return None
 
-            # Initialize the merged_df with the first processed DataFrame
-            # Using .copy() to avoid potential SettingWithCopyWarning later
-        merged_final_df = all_processed_data[0].copy()
-        # print(merged_final_df.to_string())
-
-        # Merge sequentially with subsequent DataFrames
-        for i in range(1, len(all_processed_data)):
-            df_to_merge = all_processed_data[i].copy()  # Ensure we're merging a copy
-            # print(df_to_merge.to_string())
-            # Perform the outer merge on base_columns.
-            # Since additional columns have already been uniquely renamed (e.g., '_R1', '_R2'),
-            # pandas won't need to add its own suffixes and won't find conflicts.
-            merged_final_df = pd.merge(merged_final_df, df_to_merge,
-                                       on=base_columns,
-                                       how='outer'
-                                       )
-
-        merged_final_df = coalesce_and_clean_merged_columns(merged_final_df)
+        # Combine all sheets in one pass: the sheets share the base columns and contribute
+        # branch columns, so stacking them and taking the last non-null value per college
+        # is equivalent to chaining outer merges and coalescing (which preferred the later sheet).
+        merged_final_df = pd.concat(itertools.chain([first_aligned_sheet], aligned_sheets),
+                                    ignore_index=True, sort=False)
+        # observed=True: only group on key combinations that occur, not every category product
+        merged_final_df = merged_final_df.groupby(base_columns, as_index=False, dropna=False, observed=True).last()
 
         all_columns = merged_final_df.columns.tolist()
         # Separate base and additional columns
@@ -279,19 +241,23 @@ if __name__ == "__main__":
     #              {'COMEDK_R3_09_09_2024.xlsx': "COMEDK_R3_09_09_2024_output.xlsx"}
     #              ]
 
-    wb_lists = []
+    # Each input file is parsed independently, so process them in parallel and
+    # write the (cheap) outputs serially as they complete
+    file_pairs = [(input_file, output_file) for file_map in file_data for input_file, output_file in file_map.items()]
+    generated = {}
 
-    for file_map in file_data:
-        # Each 'file_map' is a dictionary with a single key-value pair
-        for input_file, output_file in file_map.items():
+    with ProcessPoolExecutor(max_workers=len(file_pairs)) as executor:
+        futures = {}
+        for input_file, output_file in file_pairs:
             print(f"Processing input file: {input_file}")
             print(f"Output will be saved to: {output_file}")
+            future = executor.submit(process_comedk_data, absolute_input_folder, branch_codes_file_name, input_file)
+            futures[future] = (input_file, output_file)
 
-            # --- Your code goes here to process each file ---
+        for future in as_completed(futures):
+            input_file, output_file = futures[future]
             try:
-
-                # Call the processing function
-                final_output_df = process_comedk_data(absolute_input_folder, branch_codes_file_name, input_file)
+                final_output_df = future.result()
 
                 # 5. Generate output Excel file in the same input folder
                 output_full_path = os.path.join(absolute_input_folder, output_file)
@@ -299,7 +265,7 @@ if __name__ == "__main__":
                 sheet_name_from_input = os.path.splitext(os.path.basename(input_file))[0]
                 final_output_df.to_excel(output_full_path, index=False, sheet_name=sheet_name_from_input)
 
-                wb_lists.append(output_full_path)
+                generated[input_file] = output_full_path
 
                 print(f"\nSuccessfully generated '{output_full_path}' with the processed data.")
             except FileNotFoundError:
@@ -307,4 +273,7 @@ if __name__ == "__main__":
             except Exception as e:
                 print(f"An unexpected error occurred while processing '{input_file}': {e}\n")
 
+    # Keep the combined workbook's sheet order independent of completion order
+    wb_lists = [generated[input_file] for input_file, _ in file_pairs if input_file in generated]
+
     combine_sheets_from_multiple_excels(wb_lists, os.path.join(absolute_input_folder, FINAL_MERGED_OUTPUT))
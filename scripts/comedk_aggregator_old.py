@@ -12,10 +12,10 @@ def merge_excel_sheets(file_path):
     """
     try:
         # Read the four sheets into pandas DataFrames
-        cs_round1_df = pd.read_excel(file_path, sheet_name='CS-Round 1 2024')
-        cs_round2_df = pd.read_excel(file_path, sheet_name='CS-Round 2 2024')
-        is_round1_df = pd.read_excel(file_path, sheet_name='IS-Round 1 2024')
-        is_round2_df = pd.read_excel(file_path, sheet_name='IS-Round 2 2024')
+        cs_round1_df = pd.read_excel(file_path, sheet_name='CS-Round 1 2024', engine='calamine')
+        cs_round2_df = pd.read_excel(file_path, sheet_name='CS-Round 2 2024', engine='calamine')
+        is_round1_df = pd.read_excel(file_path, sheet_name='IS-Round 1 2024', engine='calamine')
+        is_round2_df = pd.read_excel(file_path, sheet_name='IS-Round 2 2024', engine='calamine')
 
         # Rename the third column in each DataFrame for clarity and to avoid duplicate column names after merging
         cs_round1_df = cs_round1_df.rename(columns={
@@ -27,10 +27,10 @@ def merge_excel_sheets(file_path):
         is_round2_df = is_round2_df.rename(columns={
             ' IS-Information Science & Engineering ROUND 2 2024': 'IS-Information Science & Engineering ROUND 2 2024'})
 
-        # Merge the DataFrames, starting with CS rounds, then adding IS rounds
-        merged_df = pd.merge(cs_round1_df, cs_round2_df, on=['College Code', 'College Name'], how='outer')
-        merged_df = pd.merge(merged_df, is_round1_df, on=['College Code', 'College Name'], how='outer')
-        merged_df = pd.merge(merged_df, is_round2_df, on=['College Code', 'College Name'], how='outer')
+        # Combine the DataFrames, starting with CS rounds, then adding IS rounds. The round columns
+        # are disjoint, so one concat + groupby on the college keys is equivalent to chained outer merges
+        merged_df = pd.concat([cs_round1_df, cs_round2_df, is_round1_df, is_round2_df], ignore_index=True, sort=False)
+        merged_df = merged_df.groupby(['College Code', 'College Name'], as_index=False, dropna=False).first()
 
         # Save the merged DataFrame to a new Excel file
         with pd.ExcelWriter(file_path, engine='openpyxl', mode='a') as writer:
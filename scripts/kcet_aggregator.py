@@ -1,13 +1,14 @@
-import math
 import os
 
-from openpyxl.styles import Border, Side, PatternFill, Font, Alignment
-
 import pandas as pd
 import re
 
-from openpyxl.reader.excel import load_workbook
-from pandas.core.computation.ops import isnumeric
+# Keywords identifying the branches of interest, matched anywhere in the branch name
+INTERESTED_BRANCH_KEYWORDS = ["computer", "artificial", "electronics", "robotics", "information", "iot", "data", "cyber"]
+INTERESTED_BRANCH_PATTERN = re.compile("|".join(INTERESTED_BRANCH_KEYWORDS), re.IGNORECASE)
+
+# Colleges whose location names put them out of scope
+EXCLUDED_COLLEGE_PATTERN = re.compile(r"KALBURGI|BANTWAL|BANGARAPET|MANGALORE|RANEBENNUR", re.IGNORECASE)
 
 def process_excel_data(file_path):
     """
@@ -23,7 +24,7 @@ def process_excel_data(file_path):
     """
     try:
         # Read the Excel file into a pandas DataFrame
-        df = pd.read_excel(file_path)
+        df = pd.read_excel(file_path, engine='calamine')
         # Check if the DataFrame is empty
         if df.empty:
             print("Error: The Excel file is empty.")
@@ -78,37 +79,42 @@ def create_dataframe_from_list(data):
     """
     if not data:
         return pd.DataFrame()  # Return an empty DataFrame if the input list is empty
-    # Extract unique college codes
-    college_codes = set(item['College Code'] for item in data)
-
-    # Create a list to store the final data rows
-    final_data = []
+    df = pd.DataFrame(data)
+    branch_columns = sorted(col for col in df.columns if col not in ['College Code', 'College Name'])
 
-    for code in college_codes:
-        # Filter data for the current college code
-        college_data = [item for item in data if item['College Code'] == code]
+    # One row per college: keep the first college name seen and, per branch, the last
+    # non-null value (later entries overwrite earlier ones)
+    aggregations = {'College Name': 'first', **{col: 'last' for col in branch_columns}}
+    final_df = df.groupby('College Code', as_index=False, sort=False).agg(aggregations)
+    return final_df
 
 
-        # Start with the base data (College Code and Name)
-        first_item = college_data[0]
-        college_row = {'College Code': first_item['College Code'], 'College Name': first_item['College Name']}
+def apply_sheet_formatting(writer, sheet_name, df):
+    """
+    Applies the standard header/body styling to a sheet written through an xlsxwriter ExcelWriter.
 
-        # Update the dictionary with the other key-value pairs
-        college_row_branches = {}
-        for item in college_data:
-            for key, value in item.items():
-                if key not in ['College Code', 'College Name']:
-                    college_row_branches[key] = value
+    Args:
+        writer (pd.ExcelWriter): The ExcelWriter (engine='xlsxwriter') the sheet was written with.
+        sheet_name (str): The name of the sheet to format.
+        df (pd.DataFrame): The DataFrame that was written to the sheet (index=False).
+    """
+    workbook = writer.book
+    worksheet = writer.sheets[sheet_name]
 
-        college_row_branches = dict(sorted(college_row_branches.items()))
-        college_row.update(college_row_branches)
-        final_data.append(college_row)
-        # print(final_data)
+    header_format = workbook.add_format({'bold': True, 'font_name': 'Arial', 'font_size': 10,
+                                         'bg_color': '#D3D3D3', 'border': 1,
+                                         'text_wrap': True, 'valign': 'top'})
+    body_format = workbook.add_format({'font_name': 'Arial', 'font_size': 10, 'border': 1,
+                                       'text_wrap': True, 'valign': 'top'})
 
-    # Create the DataFrame
-    final_df = pd.DataFrame(final_data)
-    return final_df
+    # Set column widths for the first two columns, default width for the others
+    worksheet.set_column(0, 0, 10, body_format)
+    worksheet.set_column(1, 1, 90, body_format)
+    if len(df.columns) > 2:
+        worksheet.set_column(2, len(df.columns) - 1, 18, body_format)
 
+    worksheet.set_row(0, None, header_format)
+    worksheet.write_row(0, 0, df.columns.tolist(), header_format)
 
 
 def extract_and_format_data(course_data, excel_file_path, output_file_path=None):
@@ -116,13 +122,26 @@ def extract_and_format_data(course_data, excel_file_path, output_file_path=None)
     Extracts college data from an Excel file with a specific format and converts it to a structured DataFrame,
     with "College Code" and "College Name" columns, followed by branch columns containing the "GM" cutoff rank.
 
+    The output workbook holds the formatted AGGREGATED sheet first, followed by copies of the original
+    sheets. The copies carry cell values only (no merged cells, fonts or column widths), so the output is
+    always a separate file and the source workbook is left untouched.
+
     Args:
         excel_file_path (str): The path to the Excel file.
-        output_file_path (str, optional): The path to the output Excel file. Defaults to "formatted_data.xlsx".
+        output_file_path (str, optional): The path to the output Excel file. Defaults to the input
+                                          file name with an "_output.xlsx" suffix, in the same folder.
     """
+    output_file_path = output_file_path or f"{os.path.splitext(excel_file_path)[0]}_output.xlsx"
+    if os.path.abspath(output_file_path) == os.path.abspath(excel_file_path):
+        print(f"Error: Output path must differ from the input file {excel_file_path}, which would lose its formatting.")
+        return
+
     try:
         # Read all sheets from the Excel file
-        excel_data = pd.read_excel(excel_file_path, sheet_name=None, header=None)
+        excel_data = pd.read_excel(excel_file_path, sheet_name=None, header=None, engine='calamine')
+        # An AGGREGATED sheet left in the source by earlier (in-place) runs is rebuilt below,
+        # so it is neither scanned nor copied over
+        excel_data.pop('AGGREGATED', None)
 
         all_data = []  # List to store processed data from all sheets
 
@@ -131,87 +150,43 @@ def extract_and_format_data(course_data, excel_file_path, output_file_path=None)
             print('processing sheet ', sheet_name)
 
             data = []
-            college_code = None
-            college_name = None
-            gm_index = -1
-            new_section = False
-            # Iterate through the rows
-            for i in range(len(df)):
-                row = df.iloc[i]
-
-                first_cell_value = row[0]  # The value in the first column of the current row
-
-                print(f"first cell: {first_cell_value}")  # This will now print the content of cell A1 first
-
-                if isinstance(first_cell_value, str):
-
-                    match = re.search( r".*?\(?(E\d+)\)?\s*(.*)", first_cell_value)
-                    print(first_cell_value, match)
-                    if match:
-                        college_code = match.group(1)
-                        college_name = match.group(2)
-                        print(college_code, college_name)
-                        new_section = True
-                        gm_index = -1
-                        continue  # Skip to the next row
-
-
-                # If college code and name are found, process the table
-                if college_code and college_name:
-                    # Assuming table headers are in the same row
-                    # if "BAN" not in college_name.upper() and "BEN" not in college_name.upper():
-                    #     print(f'skip college {college_name}')
-                    #     continue
-
-                    if "KALBURGI" in college_name.upper():
-                        ##print(f'skip college {college_name}')
-                        continue
-                    if "BANTWAL" in college_name.upper():
-                        print(f'skip college {college_name}')
-                        continue
-                    if "BANGARAPET" in college_name.upper():
-                        #print(f'skip college {college_name}')
-                        continue
-                    if "MANGALORE" in college_name.upper():
-                       # print(f'skip college {college_name}')
-                        continue
-                    if "RANEBENNUR" in college_name.upper():
-                        #print(f'skip college {college_name}')
-                        continue
-
-                    headers = df.iloc[i].tolist()
-                    if gm_index == -1:
-                        for j, header in enumerate(headers):
-                            if "GM" == header:
-                                gm_index = j
-                                break
-                    branch_gm_data = {'College Code': college_code, 'College Name': college_name}
-                    # check if the next row exists before accessing
-
-                    course_codes = ["computer", "artificial", "electronics","robotics", "information", "iot", "robotics", "data", "cyber"]
-                    if i + 1 < len(df):
-                        branch_row = df.iloc[i + 1].tolist()
-                        branch_name = branch_row[0]
-                        if isinstance(branch_name, str):
-                            interested_course =False
-
-                            for code in course_codes:
-                                if code in branch_name.strip().lower():
-                                    interested_course = True
-                                    break  # Found a match, no need to check further
-                            if not interested_course:
-                                continue
-
-
-                            gm_value = branch_row[gm_index]
-                            try:
-                                float(gm_value)
-                            except ValueError:
-                                continue
-                            gm_value = float(gm_value)
-                            if not math.isnan(gm_value):
-                                branch_gm_data.update({branch_name: gm_value})
-                                data.append(branch_gm_data)
+            if df.empty:
+                continue
+
+            # A text cell in the first column matching the college pattern starts a new college section
+            is_text = df[0].map(lambda value: isinstance(value, str))
+            college_header = df[0].where(is_text).astype('string').str.extract(r".*?\(?(E\d+)\)?\s*(.*)")
+            is_college_row = college_header[0].notna()
+            section = is_college_row.cumsum()
+            college_code = college_header[0].ffill()
+            college_name = college_header[1].ffill()
+
+            # Rows inside a (non-excluded) college section; each one is paired with the row that follows it
+            excluded = college_name.str.contains(EXCLUDED_COLLEGE_PATTERN, na=False)
+            in_section = ~is_college_row & college_code.notna() & college_name.fillna('').ne('') & ~excluded
+
+            # GM column per section: the first in-section row containing a 'GM' cell fixes it for the
+            # rest of the section, rows before that fall back to the last column
+            has_gm = df.eq('GM')
+            row_gm_index = pd.Series(has_gm.to_numpy().argmax(axis=1), index=df.index)
+            row_gm_index = row_gm_index.where(has_gm.any(axis=1) & in_section)
+            gm_found = row_gm_index.notna().groupby(section).cummax()
+            gm_index = row_gm_index.groupby(section).transform('first').where(gm_found, df.shape[1] - 1).astype(int)
+
+            branch_name = df[0].shift(-1)
+            branch_is_text = is_text.shift(-1, fill_value=False)
+            is_interested_branch = branch_is_text & (branch_name.where(branch_is_text).astype('string')
+                                                     .str.contains(INTERESTED_BRANCH_PATTERN, na=False))
+
+            # GM cut-off of each branch row; anything non-numeric or empty is dropped
+            branch_rows = df.index[in_section & is_interested_branch]
+            values = df.to_numpy(dtype=object)
+            gm_values = pd.Series(values[branch_rows.to_numpy() + 1, gm_index[branch_rows].to_numpy()],
+                                  index=branch_rows, dtype=object)
+            gm_values = pd.to_numeric(gm_values, errors='coerce').dropna()
+
+            data.extend({'College Code': college_code[i], 'College Name': college_name[i], branch_name[i]: gm_value}
+                        for i, gm_value in gm_values.items())
 
             # Convert the list of dictionaries to a DataFrame for the current sheet
             #formatted_df = create_dataframe_from_list(data)
@@ -226,57 +201,15 @@ def extract_and_format_data(course_data, excel_file_path, output_file_path=None)
         # Save the final DataFrame to a new Excel file
         #final_df.to_excel(output_file_path, index=False)
 
-        output_file_path = output_file_path or excel_file_path
         print(f'saving output to {output_file_path}')
-        with pd.ExcelWriter(output_file_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as excel_writer:
+        with pd.ExcelWriter(output_file_path, engine='xlsxwriter') as excel_writer:
+            # AGGREGATED goes first, followed by the original sheets as read
             final_df.to_excel(excel_writer, sheet_name='AGGREGATED', index=False)
+            apply_sheet_formatting(excel_writer, 'AGGREGATED', final_df)
+            for sheet_name, df in excel_data.items():
+                df.to_excel(excel_writer, sheet_name=sheet_name, index=False, header=False)
         print(f'saved output to {output_file_path}')
 
-        # Load the workbook and reorder sheets
-        wb = load_workbook(output_file_path)
-        sheet_to_move = wb['AGGREGATED']  # Get the sheet to move
-        wb._sheets.remove(sheet_to_move)  # Remove the sheet from its current position
-        wb._sheets.insert(0, sheet_to_move)  # Insert at the desired position (0 for the first position)
-        wb.save(output_file_path)
-        print(f"Formatted data moved as first sheet")
-
-        # Apply formatting
-        sheet = wb['AGGREGATED']
-
-        # Define the borders
-        border_style = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        default_font = Font(name='Arial', size=10)
-
-        header_font = Font(name='Arial', size=10, bold=True)
-        # Define fill
-        header_fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")  # Light Blue
-
-
-        # Set column widths for the first two columns
-        sheet.column_dimensions['A'].width = 10  # Adjust as needed
-        sheet.column_dimensions['B'].width = 90  # Adjust as needed
-
-        # Apply default width and formatting to all columns
-        for column_letter in sheet.columns:
-            col_dim = sheet.column_dimensions[column_letter[0].column_letter]
-            if column_letter[0].column_letter not in ['A', 'B']:
-                col_dim.width = 18  # Default width for other columns
-            for row_index, cell in enumerate(column_letter):
-                cell.alignment = Alignment(wrap_text=True, vertical='top')
-                cell.border = border_style
-                if row_index == 0:  # Header row
-                    cell.font = header_font
-                    cell.fill = header_fill
-                else:
-                    cell.font = default_font
-
-        wb.save(output_file_path)
-
 
     except FileNotFoundError:
         print(f"Error: File not found at {excel_file_path}")
@@ -287,12 +220,13 @@ def extract_and_format_data(course_data, excel_file_path, output_file_path=None)
 if __name__ == "__main__":
     course_data = process_excel_data("../kcet_config/COURSECODE_ENGGkannada.xlsx")
     BASE = "../kcet_files_2025"
-    # Get all Excel files in the directory
-    excel_files = [f for f in os.listdir(BASE) if f.endswith(('.xlsx', '.xls'))]
+    # Get all Excel files in the directory, skipping outputs of earlier runs
+    excel_files = [f for f in os.listdir(BASE)
+                   if f.endswith(('.xlsx', '.xls')) and not f.endswith('_output.xlsx')]
 
     for excel_file in excel_files:
         excel_file_path = os.path.join(BASE, excel_file)
         print(f"Processing file: {excel_file_path}")
-        extract_and_format_data(course_data, excel_file_path, excel_file_path)  # Pass the output file path
+        extract_and_format_data(course_data, excel_file_path)  # Output goes to <name>_output.xlsx
 
     print("All files processed.")